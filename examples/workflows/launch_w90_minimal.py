@@ -14,7 +14,7 @@ import click
 
 from aiida.cmdline.params import options, types
 from aiida.cmdline.utils import decorators
-from aiida.engine import run
+from aiida.engine import run, submit
 from aiida.orm import Dict, Group, Str
 from aiida.orm.nodes.data import upf
 from aiida.plugins import DataFactory
@@ -23,11 +23,14 @@ from aiida_wannier90.orbitals import generate_projections
 from aiida_wannier90.workflows.minimal import MinimalW90WorkChain
 
 
-def get_static_inputs():
+def get_static_inputs(projections=None):
     """Return a dictionary of static inputs for this example.
 
     Other dynamic inputs depending on the user configuration (e.g., code names)
     are generated outside.
+
+    :param projections: an existing ``OrbitalData`` node to use for the projections;
+        if not given, new sp^3 projections centred on As are generated.
     """
     ####Input needed to run the workchain
     KpointsData = DataFactory("core.array.kpoints")
@@ -74,16 +77,17 @@ def get_static_inputs():
             ],
         }
     )
-    # sp^3 projections, centered on As
-    projections = generate_projections(
-        {
-            "position_cart": (-a / 4.0, a / 4.0, a / 4.0),
-            "ang_mtm_l": -3,
-            "spin": None,
-            "spin_axis": None,
-        },
-        structure=structure,
-    )
+    if projections is None:
+        # sp^3 projections, centered on As
+        projections = generate_projections(
+            {
+                "position_cart": (-a / 4.0, a / 4.0, a / 4.0),
+                "ang_mtm_l": -3,
+                "spin": None,
+                "spin_axis": None,
+            },
+            structure=structure,
+        )
 
     return {
         "structure": structure,
@@ -191,28 +195,65 @@ WANCODE = options.OverridableOption(
     help="The Wannier90 wannier90.x code",
 )
 
+PROJECTIONS = options.OverridableOption(
+    "--projections",
+    type=types.DataParamType(sub_classes=("aiida.data:core.orbital",)),
+    help="An existing OrbitalData node to use for the projections; by default new ones are generated",
+)
+
+DAEMON = options.OverridableOption(
+    "-d",
+    "--daemon",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Submit the workchain to the daemon instead of running it in the current interpreter",
+)
+
 
 @click.command()
 @click.help_option("-h", "--help")
 @PWCODE()
 @PW2WANCODE()
 @WANCODE()
+@PROJECTIONS()
+@DAEMON()
 @decorators.with_dbenv()
-def run_wf(pwscf_code, pw2wannier90_code, wannier_code):
-    """Run a simple workflow running Quantum ESPRESSO+wannier90 for GaAs."""
-    static_inputs = get_static_inputs()
+def run_wf(pwscf_code, pw2wannier90_code, wannier_code, projections, daemon):
+    """Run a simple workflow running Quantum ESPRESSO+wannier90 for GaAs.
+
+    With ``--daemon`` the workchain is only submitted and the script returns
+    immediately, so that it can be called in a loop without blocking; make sure
+    the daemon is running (``verdi daemon start``).
+
+    To skip calculations that were already run with identical inputs, enable caching, e.g. with
+    ``verdi config set caching.enabled_for aiida.calculations:quantumespresso.pw``
+    (see the documentation of the minimal workflow for the full list of calculations).
+    """
+    static_inputs = get_static_inputs(projections=projections)
 
     pseudo_family_name = get_or_create_pseudo_family()
 
-    # Run the workflow
-    run(
-        MinimalW90WorkChain,
-        pw_code=pwscf_code,  # load_code('pw-6.4-release@localhost'),
-        pseudo_family=Str(pseudo_family_name),  # Str('SSSP_efficiency_pseudos'),
-        wannier_code=wannier_code,  # load_code('wannier90-3-desktop@localhost'),
-        pw2wannier90_code=pw2wannier90_code,  # load_code('pw2wannier90-6.4-release@localhost'),
+    inputs = {
+        "pw_code": pwscf_code,  # load_code('pw-6.4-release@localhost'),
+        "pseudo_family": Str(pseudo_family_name),  # Str('SSSP_efficiency_pseudos'),
+        "wannier_code": wannier_code,  # load_code('wannier90-3-desktop@localhost'),
+        "pw2wannier90_code": pw2wannier90_code,  # load_code('pw2wannier90-6.4-release@localhost'),
         **static_inputs,
-    )
+    }
+
+    if daemon:
+        node = submit(MinimalW90WorkChain, **inputs)
+        print(f"Submitted MinimalW90WorkChain<{node.pk}>")
+    else:
+        # Run the workflow
+        run(MinimalW90WorkChain, **inputs)
+
+    if projections is None:
+        print(
+            f"Projections stored as OrbitalData<{static_inputs['projections'].pk}>; "
+            "this node can be passed with --projections in later runs"
+        )
 
 
 if __name__ == "__main__":
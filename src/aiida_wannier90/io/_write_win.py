@@ -83,12 +83,14 @@ def _create_win_string(  # pylint: disable=too-many-arguments
 ):
     """Generate a string with the content of a .win file."""
     from aiida.orm import List
-    from aiida.plugins import DataFactory
 
     # prepare the main input text
     input_file_lines = []
-    if isinstance(parameters, DataFactory("core.dict")):
+    if isinstance(parameters, orm.Dict):
         parameters = parameters.get_dict()
+    else:
+        # Work on a copy, so that setting the default `mp_grid` does not modify the caller's dictionary
+        parameters = dict(parameters)
     try:
         parameters.setdefault("mp_grid", kpoints.get_kpoints_mesh()[0])
     except AttributeError:
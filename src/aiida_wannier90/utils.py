@@ -17,8 +17,8 @@ def plot_centres_xsf(structure, w90_calc, filename="./wannier.xsf"):
     # Disabling the import-error since this is an optional requirement
     import ase  # pylint: disable=import-error,useless-suppression
 
-    a = structure.get_ase()
-    new_a = a.copy()
+    # `get_ase` already returns a new `Atoms` object, so it can be extended in place
+    new_a = structure.get_ase()
     out = w90_calc.out.output_parameters.get_dict()["wannier_functions_output"]
     coords = [i["wf_centres"] for i in out]
     for c in coords:
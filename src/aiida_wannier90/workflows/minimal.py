@@ -7,12 +7,57 @@
 # For further information on the license, see the LICENSE.txt file             #
 ################################################################################
 """A minimal WorkChain to run Wannier90."""
+from types import MappingProxyType
+
+import numpy as np
+
 from aiida import orm
 from aiida.engine import ToContext, WorkChain, calcfunction
 from aiida.orm import Dict
 from aiida.orm.nodes.data.upf import get_pseudos_from_structure
 from aiida.plugins import CalculationFactory
 
+from ..calculations import Wannier90Calculation
+
+# A fixed value, for testing
+_ECUTWFC = 30.0
+
+# Templates that do not depend on the inputs: built once, and read-only so that they cannot be
+# modified by mistake when preparing the parameters of a specific calculation
+_PW_PARAMETERS = MappingProxyType(
+    {
+        "CONTROL": MappingProxyType({}),
+        "SYSTEM": MappingProxyType(
+            {
+                "ecutwfc": _ECUTWFC,
+                "ecutrho": _ECUTWFC * 8.0,
+            }
+        ),
+    }
+)
+
+_W90_PARAMETERS = MappingProxyType(
+    {
+        "write_hr": False,
+        "write_xyz": False,
+        "use_ws_distance": True,
+        "bands_plot": True,
+        "num_iter": 200,
+        "guiding_centres": False,
+        "num_wann": 4,
+        # A fixed value, for testing
+        "exclude_bands": (1, 2, 3, 4, 5),
+    }
+)
+
+_PW2WANNIER_INPUTPP = MappingProxyType(
+    {
+        "write_amn": True,
+        "write_unk": True,
+        "write_mmn": True,
+    }
+)
+
 
 class MinimalW90WorkChain(WorkChain):
     """Workchain to run a full stack of Quantum ESPRESSO + Wannier90 for GaAs.
@@ -85,6 +130,7 @@ class MinimalW90WorkChain(WorkChain):
         )
 
         spec.outline(
+            cls.setup,
             cls.run_pw_scf,
             cls.run_pw_nscf,
             cls.run_w90_pp,
@@ -100,38 +146,34 @@ class MinimalW90WorkChain(WorkChain):
         spec.output("pw2wan_remote_folder", valid_type=orm.RemoteData)
         spec.output("wannier_bands", valid_type=orm.BandsData)
 
+    def _get_metadata(self, withmpi):
+        """Return the ``metadata`` input for a calculation with the resources of this workchain."""
+        return {
+            "options": {
+                # int is used to convert from AiiDA nodes to python ints
+                "resources": {"num_machines": int(self.inputs.num_machines)},
+                "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
+                "withmpi": withmpi,
+            }
+        }
+
+    def setup(self):
+        """Resolve the inputs that are shared by several steps."""
+        # Querying the pseudopotential family hits the database, so do it once and reuse it for SCF and NSCF
+        self.ctx.pseudos = get_pseudos_from_structure(
+            self.inputs.structure, self.inputs.pseudo_family.value
+        )
+
     def run_pw_scf(self):
         """Run the SCF with pw.x."""
 
-        # A fixed value, for testing
-        ecutwfc = 30.0
-
-        self.ctx.scf_parameters = {
-            "CONTROL": {
-                "calculation": "scf",
-            },
-            "SYSTEM": {
-                "ecutwfc": ecutwfc,
-                "ecutrho": ecutwfc * 8.0,
-            },
-        }
-
         inputs = {
             "code": self.inputs.pw_code,
             "structure": self.inputs.structure,
-            "pseudos": get_pseudos_from_structure(
-                self.inputs.structure, self.inputs.pseudo_family.value
-            ),
-            "parameters": orm.Dict(self.ctx.scf_parameters),
+            "pseudos": self.ctx.pseudos,
+            "parameters": orm.Dict(_get_pw_parameters("scf")),
             "kpoints": self.inputs.kpoints_scf,
-            "metadata": {
-                "options": {
-                    # int is used to convert from AiiDA nodes to python ints
-                    "resources": {"num_machines": int(self.inputs.num_machines)},
-                    "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
-                    "withmpi": True,
-                }
-            },
+            "metadata": self._get_metadata(withmpi=True),
         }
 
         running = self.submit(CalculationFactory("quantumespresso.pw"), **inputs)
@@ -145,42 +187,26 @@ class MinimalW90WorkChain(WorkChain):
         self.out("scf_output", self.ctx.pw_scf.outputs.output_parameters)
 
         try:
-            # Check if it's an explicit list of kpoints; this raises AttributeError if it's a mesh
-            self.inputs.kpoints_nscf.get_kpoints()
-            # If I am here, this an explicit grid, I stop
+            # This raises AttributeError if an explicit list of kpoints was passed instead of a mesh
+            mesh, offset = self.inputs.kpoints_nscf.get_kpoints_mesh()
+        except AttributeError as exc:
             raise ValueError(
                 "You should pass an MP grid; we'll take care of converting to an explicit one"
-            )
-        except AttributeError:
-            # Check that the one provided is an unshifted mesh
-            assert self.inputs.kpoints_nscf.get_kpoints_mesh()[1] == [
-                0,
-                0,
-                0,
-            ], "You should pass an unshifted mesh"
-            self.ctx.kpoints_nscf_explicit = get_explicit_kpoints(
-                self.inputs.kpoints_nscf
-            )
-
-        nscf_parameters = self.ctx.scf_parameters.copy()
-        nscf_parameters["CONTROL"]["calculation"] = "nscf"
+            ) from exc
+        # Check that the one provided is an unshifted mesh
+        assert offset == [0, 0, 0], "You should pass an unshifted mesh"
+        # Stored to avoid reading the node attributes again when setting `mp_grid`
+        self.ctx.kpoints_nscf_mesh = mesh
+        self.ctx.kpoints_nscf_explicit = get_explicit_kpoints(self.inputs.kpoints_nscf)
 
         inputs = {
             "code": self.inputs.pw_code,
             "structure": self.inputs.structure,
-            "pseudos": get_pseudos_from_structure(
-                self.inputs.structure, self.inputs.pseudo_family.value
-            ),
-            "parameters": orm.Dict(nscf_parameters),
+            "pseudos": self.ctx.pseudos,
+            "parameters": orm.Dict(_get_pw_parameters("nscf")),
             "kpoints": self.ctx.kpoints_nscf_explicit,
             "parent_folder": self.ctx.pw_scf.outputs.remote_folder,
-            "metadata": {
-                "options": {
-                    "resources": {"num_machines": int(self.inputs.num_machines)},
-                    "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
-                    "withmpi": True,
-                }
-            },
+            "metadata": self._get_metadata(withmpi=True),
         }
 
         running = self.submit(CalculationFactory("quantumespresso.pw"), **inputs)
@@ -193,39 +219,23 @@ class MinimalW90WorkChain(WorkChain):
 
         self.out("nscf_output", self.ctx.pw_nscf.outputs.output_parameters)
 
-        # A fixed value, for testing
-        self.ctx.exclude_bands = [1, 2, 3, 4, 5]
-
-        self.ctx.w90_pp_parameters = {
-            "mp_grid": self.inputs.kpoints_nscf.get_kpoints_mesh()[0],
-            "write_hr": False,
-            "write_xyz": False,
-            "use_ws_distance": True,
-            "bands_plot": True,
-            "num_iter": 200,
-            "guiding_centres": False,
-            "num_wann": 4,
-            "exclude_bands": self.ctx.exclude_bands,
-        }
+        # The same node is used for the pre-processing and the main run, so that both share the input
+        self.ctx.w90_parameters = orm.Dict(
+            {"mp_grid": self.ctx.kpoints_nscf_mesh, **_W90_PARAMETERS}
+        )
 
         inputs = {
             "code": self.inputs.wannier_code,
             "structure": self.inputs.structure,
-            "parameters": orm.Dict(self.ctx.w90_pp_parameters),
+            "parameters": self.ctx.w90_parameters,
             "kpoints": self.ctx.kpoints_nscf_explicit,
             "kpoint_path": self.inputs.kpoint_path,
             "projections": self.inputs.projections,
             "settings": Dict({"postproc_setup": True}),
-            "metadata": {
-                "options": {
-                    "resources": {"num_machines": int(self.inputs.num_machines)},
-                    "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
-                    "withmpi": False,  # serial run
-                }
-            },
+            "metadata": self._get_metadata(withmpi=False),
         }
 
-        running = self.submit(CalculationFactory("wannier90.wannier90"), **inputs)
+        running = self.submit(Wannier90Calculation, **inputs)
         self.report(f"launching Wannier90<{running.pk}> (pp step)")
 
         return ToContext(w90_pp=running)
@@ -234,27 +244,14 @@ class MinimalW90WorkChain(WorkChain):
         """Run pw2wannier90.x."""
         self.out("nnkp_file", self.ctx.w90_pp.outputs.nnkp_file)
 
-        self.ctx.pw2wannier_parameters = {
-            "inputpp": {
-                "write_amn": True,
-                "write_unk": True,
-                "write_mmn": True,
-            }
-        }
         settings = {"ADDITIONAL_RETRIEVE_LIST": ["*.amn", "*.mmn", "*.eig"]}
         inputs = {
             "code": self.inputs.pw2wannier90_code,
-            "parameters": orm.Dict(self.ctx.pw2wannier_parameters),
+            "parameters": orm.Dict({"inputpp": {**_PW2WANNIER_INPUTPP}}),
             "parent_folder": self.ctx.pw_nscf.outputs.remote_folder,
             "nnkp_file": self.ctx.w90_pp.outputs.nnkp_file,
             "settings": Dict(settings),
-            "metadata": {
-                "options": {
-                    "resources": {"num_machines": int(self.inputs.num_machines)},
-                    "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
-                    "withmpi": True,
-                }
-            },
+            "metadata": self._get_metadata(withmpi=True),
         }
         running = self.submit(
             CalculationFactory("quantumespresso.pw2wannier90"), **inputs
@@ -271,21 +268,15 @@ class MinimalW90WorkChain(WorkChain):
         inputs = {
             "code": self.inputs.wannier_code,
             "structure": self.inputs.structure,
-            "parameters": orm.Dict(self.ctx.w90_pp_parameters),
+            "parameters": self.ctx.w90_parameters,
             "kpoints": self.ctx.kpoints_nscf_explicit,
             "kpoint_path": self.inputs.kpoint_path,
             "remote_input_folder": self.ctx.pw2wannier.outputs.remote_folder,
             "projections": self.inputs.projections,
-            "metadata": {
-                "options": {
-                    "resources": {"num_machines": int(self.inputs.num_machines)},
-                    "max_wallclock_seconds": int(self.inputs.max_wallclock_seconds),
-                    "withmpi": False,
-                }
-            },
+            "metadata": self._get_metadata(withmpi=False),
         }
 
-        running = self.submit(CalculationFactory("wannier90.wannier90"), **inputs)
+        running = self.submit(Wannier90Calculation, **inputs)
         self.report(f"launching Wannier90<{running.pk}> (main run)")
 
         return ToContext(w90=running)
@@ -295,11 +286,29 @@ class MinimalW90WorkChain(WorkChain):
         self.out("wannier_bands", self.ctx.w90.outputs.interpolated_bands)
 
 
+def _get_pw_parameters(calculation):
+    """Return a new ``pw.x`` parameters dictionary, built from the template, for the given ``calculation``."""
+    # Copy each namelist: they must not be shared between calculations, nor with the template
+    parameters = {namelist: dict(values) for namelist, values in _PW_PARAMETERS.items()}
+    parameters["CONTROL"]["calculation"] = calculation
+    return parameters
+
+
+def _explicit_kpoints_from_mesh(mesh, offset):
+    """Expand a Monkhorst-Pack mesh into an explicit ``(N, 3)`` array of crystal coordinates.
+
+    The ordering is the same as ``KpointsData.get_kpoints_mesh(print_list=True)``.
+    """
+    mesh = np.asarray(mesh)
+    indices = np.indices(mesh).reshape(3, -1).T
+    return (indices + np.asarray(offset)) / mesh
+
+
 @calcfunction
 def get_explicit_kpoints(kpoints):
     """Convert from a mesh to an explicit list."""
     from aiida.orm import KpointsData
 
     kpt = KpointsData()
-    kpt.set_kpoints(kpoints.get_kpoints_mesh(print_list=True))
+    kpt.set_kpoints(_explicit_kpoints_from_mesh(*kpoints.get_kpoints_mesh()))
     return kpt
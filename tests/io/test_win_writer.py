@@ -41,3 +41,14 @@ def test_exclude_bands(generate_kpoints_mesh, file_regression):
     parameters = {"exclude_bands": range(-1, 1)}
     with pytest.raises(InputValidationError):
         _create_win_string(parameters, generate_kpoints_mesh(2))
+
+
+def test_parameters_not_modified(generate_kpoints_mesh):
+    """Test that _create_win_string does not modify the input parameters dictionary."""
+    from aiida_wannier90.io._write_win import _create_win_string
+
+    parameters = {"num_wann": 4}
+    win_string = _create_win_string(parameters, generate_kpoints_mesh(2))
+
+    assert "mp_grid" in win_string
+    assert parameters == {"num_wann": 4}
@@ -0,0 +1,34 @@
+################################################################################
+# Copyright (c), AiiDA team and individual contributors.                       #
+#  All rights reserved.                                                        #
+# This file is part of the AiiDA-wannier90 code.                               #
+#                                                                              #
+# The code is hosted on GitHub at https://github.com/aiidateam/aiida-wannier90 #
+# For further information on the license, see the LICENSE.txt file             #
+################################################################################
+"""Tests for the helpers of the `MinimalW90WorkChain`."""
+import numpy as np
+import pytest
+
+from aiida import orm
+
+
+@pytest.mark.parametrize(
+    "mesh, offset",
+    [
+        ([2, 2, 2], [0, 0, 0]),
+        ([3, 4, 5], [0, 0, 0]),
+        ([4, 1, 3], [0.5, 0, 0.5]),
+    ],
+)
+def test_explicit_kpoints_from_mesh(mesh, offset):
+    """Test that the explicit list matches the one generated by `KpointsData`."""
+    from aiida_wannier90.workflows.minimal import _explicit_kpoints_from_mesh
+
+    kpoints = orm.KpointsData()
+    kpoints.set_kpoints_mesh(mesh, offset=offset)
+
+    explicit = _explicit_kpoints_from_mesh(mesh, offset)
+
+    assert explicit.shape == (np.prod(mesh), 3)
+    np.testing.assert_allclose(explicit, kpoints.get_kpoints_mesh(print_list=True))